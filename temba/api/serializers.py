@@ -5,17 +5,70 @@ import phonenumbers
 
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Prefetch
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 from temba.campaigns.models import Campaign, CampaignEvent, FLOW_EVENT, MESSAGE_EVENT
 from temba.channels.models import Channel
 from temba.contacts.models import Contact, ContactField, ContactGroup, ContactURN, TEL_SCHEME
-from temba.flows.models import Flow, FlowRun
+from temba.flows.models import Flow, FlowRun, FlowStep, RuleSet
 from temba.locations.models import AdminBoundary
 from temba.msgs.models import Msg, Call, Broadcast, Label, ARCHIVED, INCOMING
 from temba.values.models import VALUE_TYPE_CHOICES
 
+# max number of parsed phone numbers we keep around
+E164_CACHE_SIZE = 8192
+
+_e164_cache = dict()
+_e164_missing = object()
+
+
+def format_e164(phone, country_code=None):
+    """
+    Parses the given phone number and returns it formatted as E164, or None if it isn't a possible number. Parsing is
+    expensive and the same numbers tend to recur (retries, imports) so results are cached.
+    """
+    # a single lookup as the cache may be cleared by another thread at any time
+    key = (phone, country_code)
+    cached = _e164_cache.get(key, _e164_missing)
+    if cached is not _e164_missing:
+        return cached
+
+    try:
+        normalized = phonenumbers.parse(phone, country_code)
+        if phonenumbers.is_possible_number(normalized):
+            formatted = phonenumbers.format_number(normalized, phonenumbers.PhoneNumberFormat.E164)
+        else:
+            formatted = None
+    except Exception:
+        formatted = None
+
+    if len(_e164_cache) >= E164_CACHE_SIZE:
+        _e164_cache.clear()
+
+    _e164_cache[key] = formatted
+    return formatted
+
+
+def _resolve_by_uuids(queryset, uuids, error_msg):
+    """
+    Fetches the objects with the given UUIDs from the given queryset with a single query, returning them in the order of
+    the UUIDs, and raising a validation error for the first UUID without a match
+    """
+    if not uuids:
+        return []
+
+    objs_by_uuid = {obj.uuid: obj for obj in queryset.filter(uuid__in=uuids)}
+
+    objs = []
+    for uuid in uuids:
+        obj = objs_by_uuid.get(uuid)
+        if not obj:
+            raise ValidationError(error_msg % uuid)
+        objs.append(obj)
+
+    return objs
+
 
 # ------------------------------------------------------------------------------------------
 # Field types
@@ -133,58 +186,77 @@ class WriteSerializer(serializers.Serializer):
 
     def restore_fields(self, data, files):
 
-        if not isinstance(data, dict):
+        # parsed JSON bodies are plain dicts so check for that first, falling back to allowing any dict subclass
+        if type(data) is not dict and not isinstance(data, dict):
             self._errors['non_field_errors'] = ["Request body should be a single JSON object"]
             return {}
 
         return super(WriteSerializer, self).restore_fields(data, files)
 
+    def get_tel_sender(self):
+        """
+        Gets the org's channel for sending to tel URNs, looked up once and shared by all users of our context
+        """
+        if 'tel_sender' not in self.context:
+            self.context['tel_sender'] = self.org.get_send_channel(TEL_SCHEME)
+        return self.context['tel_sender']
 
-class MsgReadSerializer(serializers.ModelSerializer):
-    id = serializers.SerializerMethodField('get_id')
-    broadcast = serializers.SerializerMethodField('get_broadcast')
-    contact = serializers.SerializerMethodField('get_contact_uuid')
-    urn = serializers.SerializerMethodField('get_urn')
-    status = serializers.SerializerMethodField('get_status')
-    archived = serializers.SerializerMethodField('get_archived')
-    relayer = serializers.SerializerMethodField('get_relayer')
-    type = serializers.SerializerMethodField('get_type')
-    labels = serializers.SerializerMethodField('get_labels')
-
-    def get_id(self, obj):
-        return obj.pk
-
-    def get_broadcast(self, obj):
-        return obj.broadcast_id
-
-    def get_type(self, obj):
-        return obj.msg_type
-
-    def get_urn(self, obj):
-        if obj.org.is_anon:
-            return None
-        return obj.contact_urn.urn
-
-    def get_contact_uuid(self, obj):
-        return obj.contact.uuid
-
-    def get_relayer(self, obj):
-        return obj.channel_id
+    def get_contacts_by_uuids(self, uuids):
+        """
+        Gets the active contacts in our org with the given UUIDs, in the same order, with a single query
+        """
+        return _resolve_by_uuids(Contact.objects.filter(org=self.org, is_active=True), uuids,
+                                 _("Unable to find contact with uuid: %s"))
 
-    def get_status(self, obj):
-        # PENDING and QUEUED are same as far as users are concerned
-        return 'Q' if obj.status in ['Q', 'P'] else obj.status
+    def get_groups_by_uuids(self, uuids):
+        """
+        Gets the active user groups in our org with the given UUIDs, in the same order, with a single query
+        """
+        return _resolve_by_uuids(ContactGroup.user_groups.filter(org=self.org, is_active=True), uuids,
+                                 _("Unable to find contact group with uuid: %s"))
 
-    def get_archived(self, obj):
-        return obj.visibility == ARCHIVED
 
-    def get_labels(self, obj):
-        return [l.name for l in obj.labels.all()]
+class MsgReadSerializer(serializers.ModelSerializer):
+    """
+    Messages are our most requested resource so rather than resolving each value through its own field, we build the
+    representation of each message directly. Only the date fields are declared as we use them for formatting.
+    """
+    def to_native(self, obj):
+        fields = self.fields
+        labels = obj.prefetched_labels if hasattr(obj, 'prefetched_labels') else obj.labels.all()
+
+        ret = self._dict_class()
+        ret['id'] = obj.pk
+        ret['broadcast'] = obj.broadcast_id
+        ret['contact'] = obj.contact.uuid
+        ret['urn'] = None if obj.org.is_anon else obj.contact_urn.urn
+        ret['status'] = 'Q' if obj.status in ('Q', 'P') else obj.status  # PENDING and QUEUED are same to users
+        ret['type'] = obj.msg_type
+        ret['labels'] = [l.name for l in labels]
+        ret['relayer'] = obj.channel_id
+        ret['direction'] = obj.direction
+        ret['archived'] = obj.visibility == ARCHIVED
+        ret['text'] = obj.text
+        ret['created_on'] = fields['created_on'].to_native(obj.created_on)
+        ret['sent_on'] = fields['sent_on'].to_native(obj.sent_on)
+        ret['delivered_on'] = fields['delivered_on'].to_native(obj.delivered_on)
+        return ret
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        # labels are only needed for their names so prefetch those as a new attribute
+        labels_prefetch = Prefetch('labels', queryset=Label.user_labels.only('name'), to_attr='prefetched_labels')
+
+        # only load the columns we use from each message and the rows joined to it
+        queryset = queryset.only('org', 'org__is_anon', 'contact', 'contact__uuid', 'contact_urn', 'contact_urn__urn',
+                                 'broadcast', 'channel', 'status', 'msg_type', 'direction', 'visibility', 'text',
+                                 'created_on', 'sent_on', 'delivered_on')
+
+        return queryset.select_related('org', 'contact', 'contact_urn').prefetch_related(labels_prefetch)
 
     class Meta:
         model = Msg
-        fields = ('id', 'broadcast', 'contact', 'urn', 'status', 'type', 'labels', 'relayer',
-                  'direction', 'archived', 'text', 'created_on', 'sent_on', 'delivered_on')
+        fields = ('created_on', 'sent_on', 'delivered_on')
 
 
 class MsgBulkActionSerializer(WriteSerializer):
@@ -194,13 +266,15 @@ class MsgBulkActionSerializer(WriteSerializer):
     label_uuid = serializers.CharField(required=False)
 
     def validate(self, attrs):
-        if attrs['action'] in ('label', 'unlabel') and not ('label' in attrs or 'label_uuid' in attrs):
-            raise ValidationError("For action %s you must also specify label or label_uuid" % attrs['action'])
+        action = attrs['action']
+        if action in ('label', 'unlabel') and not ('label' in attrs or 'label_uuid' in attrs):
+            raise ValidationError("For action %s you must also specify label or label_uuid" % action)
         return attrs
 
     def validate_action(self, attrs, source):
-        if attrs[source] not in ('label', 'unlabel', 'archive', 'unarchive', 'delete'):
-            raise ValidationError("Invalid action name: %s" % attrs[source])
+        action = attrs[source]
+        if action not in ('label', 'unlabel', 'archive', 'unarchive', 'delete'):
+            raise ValidationError("Invalid action name: %s" % action)
         return attrs
 
     def validate_label(self, attrs, source):
@@ -234,16 +308,12 @@ class MsgBulkActionSerializer(WriteSerializer):
             attrs['label'].toggle_label(msgs, add=True)
         elif action == 'unlabel':
             attrs['label'].toggle_label(msgs, add=False)
-        else:
-            # these are in-efficient but necessary to keep cached counts correct. In future if counts are completely
-            # driven by triggers these could be replaced with queryset bulk update operations.
-            for msg in msgs:
-                if action == 'archive':
-                    msg.archive()
-                elif action == 'unarchive':
-                    msg.restore()
-                elif action == 'delete':
-                    msg.release()
+        elif action == 'archive':
+            Msg.bulk_archive(msgs)
+        elif action == 'unarchive':
+            Msg.bulk_restore(msgs)
+        elif action == 'delete':
+            Msg.bulk_release(msgs)
 
     class Meta:
         fields = ('messages', 'action', 'label', 'label_uuid')
@@ -252,10 +322,7 @@ class MsgBulkActionSerializer(WriteSerializer):
 class LabelReadSerializer(serializers.ModelSerializer):
     uuid = serializers.Field(source='uuid')
     name = serializers.Field(source='name')
-    count = serializers.SerializerMethodField('get_count')
-
-    def get_count(self, obj):
-        return obj.get_visible_count()
+    count = serializers.Field(source='visible_count')  # maintained by db triggers so no need to count here
 
     class Meta:
         model = Label
@@ -303,10 +370,7 @@ class ContactGroupReadSerializer(serializers.ModelSerializer):
     group = serializers.Field(source='id')  # deprecated, use uuid
     uuid = serializers.Field(source='uuid')
     name = serializers.Field(source='name')
-    size = serializers.SerializerMethodField('get_size')
-
-    def get_size(self, obj):
-        return obj.get_member_count()
+    size = serializers.Field(source='count')  # maintained by db triggers so no need to count here
 
     class Meta:
         model = ContactGroup
@@ -314,41 +378,57 @@ class ContactGroupReadSerializer(serializers.ModelSerializer):
 
 
 class ContactReadSerializer(serializers.ModelSerializer):
-    name = serializers.Field(source='name')
-    uuid = serializers.Field(source='uuid')
-    language = serializers.Field(source='language')
-    group_uuids = serializers.SerializerMethodField('get_group_uuids')
-    urns = serializers.SerializerMethodField('get_urns')
-    fields = serializers.SerializerMethodField('get_contact_fields')
-    phone = serializers.SerializerMethodField('get_tel')  # deprecated, use urns
-    groups = serializers.SerializerMethodField('get_groups')  # deprecated, use group_uuids
+    """
+    As with messages, we build the representation of each contact directly rather than resolving each value through
+    its own field. Only the date fields are declared as we use them for formatting.
+    """
+    def to_native(self, obj):
+        fields = self.fields
+        org = obj.org
+        is_anon = org.is_anon
 
-    def get_groups(self, obj):
         groups = obj.prefetched_user_groups if hasattr(obj, 'prefetched_user_groups') else obj.user_groups.all()
-        return [_.name for _ in groups]
+        contact_fields = {f.key: Contact.get_field_display_for_value(f, obj.get_field(f.key))
+                          for f in self.get_contact_fields(org)}
+
+        ret = self._dict_class()
+        ret['uuid'] = obj.uuid
+        ret['name'] = obj.name
+        ret['language'] = obj.language
+        ret['group_uuids'] = [g.uuid for g in groups]
+        ret['urns'] = dict() if is_anon else [urn.urn for urn in obj.get_urns()]
+        ret['fields'] = contact_fields
+        ret['modified_on'] = fields['modified_on'].to_native(obj.modified_on)
+
+        # deprecated, use urns
+        ret['phone'] = obj.anon_identifier if is_anon else obj.get_urn_display(org, scheme=TEL_SCHEME, full=True)
+        ret['groups'] = [g.name for g in groups]  # deprecated, use group_uuids
+        return ret
+
+    def get_contact_fields(self, org):
+        """
+        Gets the org's active contact fields, evaluated once and reused for every contact being serialized
+        """
+        if not hasattr(self, '_contact_fields'):
+            self._contact_fields = tuple(self.context['contact_fields'])
 
-    def get_group_uuids(self, obj):
-        groups = obj.prefetched_user_groups if hasattr(obj, 'prefetched_user_groups') else obj.user_groups.all()
-        return [_.uuid for _ in groups]
+            # saves each field fetching the org again when it formats a datetime value
+            for field in self._contact_fields:
+                field.org = org
 
-    def get_urns(self, obj):
-        if obj.org.is_anon:
-            return dict()
+        return self._contact_fields
 
-        return [urn.urn for urn in obj.get_urns()]
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        # can't prefetch a custom manager directly, so here we prefetch user groups as new attribute
+        user_groups_prefetch = Prefetch('all_groups', queryset=ContactGroup.user_groups.all(),
+                                        to_attr='prefetched_user_groups')
 
-    def get_contact_fields(self, obj):
-        fields = dict()
-        for contact_field in self.context['contact_fields']:
-            fields[contact_field.key] = obj.get_field_display(contact_field.key)
-        return fields
-
-    def get_tel(self, obj):
-        return obj.get_urn_display(obj.org, scheme=TEL_SCHEME, full=True)
+        return queryset.select_related('org').prefetch_related(user_groups_prefetch)
 
     class Meta:
         model = Contact
-        fields = ('uuid', 'name', 'language', 'group_uuids', 'urns', 'fields', 'modified_on', 'phone', 'groups')
+        fields = ('modified_on',)
 
 
 class ContactWriteSerializer(WriteSerializer):
@@ -374,18 +454,16 @@ class ContactWriteSerializer(WriteSerializer):
 
         if uuid:
             if phone:
-                urns = [(TEL_SCHEME, attrs['phone'])]
+                urns = [(TEL_SCHEME, phone)]
 
             if urns:
-                urns_strings = ["%s:%s" % u for u in urns]
-                urn_query = Q(pk__lt=0)
-                for urn_string in urns_strings:
-                    urn_query |= Q(urns__urn__iexact=urn_string)
+                # URNs are normalized by this point and are stored that way, so they can be matched exactly
+                urns_strings = [scheme + ':' + path for scheme, path in urns]
 
-                other_contacts = Contact.objects.filter(org=self.org)
-                other_contacts = other_contacts.filter(urn_query).distinct()
+                # no need for distinct() as we only care whether any exist
+                other_contacts = Contact.objects.filter(org=self.org, urns__urn__in=urns_strings)
                 other_contacts = other_contacts.exclude(uuid=uuid)
-                if other_contacts:
+                if other_contacts.exists():
                     if phone:
                         raise ValidationError(_("phone %s is used by another contact") % phone)
                     raise ValidationError(_("URNs %s are used by other contacts") % urns_strings)
@@ -395,9 +473,10 @@ class ContactWriteSerializer(WriteSerializer):
     def validate_language(self, attrs, source):
         if 'language' in attrs:
             language = attrs.get(source, None)
-            supported_languages = [l.iso_code for l in self.user.get_org().languages.all()]
 
             if language:
+                supported_languages = [l.iso_code for l in self.context['languages']]
+
                 # no languages configured
                 if not supported_languages:
                     raise ValidationError(_("You do not have any languages configured for your organization."))
@@ -425,15 +504,11 @@ class ContactWriteSerializer(WriteSerializer):
     def validate_phone(self, attrs, source):
         phone = attrs.get(source, None)
         if phone:
-            try:
-                normalized = phonenumbers.parse(phone, None)
-                if not phonenumbers.is_possible_number(normalized):
-                    raise ValidationError("Invalid phone number: '%s'" % phone)
-            except:  # pragma: no cover
+            normalized = format_e164(phone)
+            if not normalized:
                 raise ValidationError("Invalid phone number: '%s'" % phone)
 
-            phone = phonenumbers.format_number(normalized, phonenumbers.PhoneNumberFormat.E164)
-            attrs['phone'] = phone
+            attrs['phone'] = normalized
         return attrs
 
     def validate_urns(self, attrs, source):
@@ -459,16 +534,15 @@ class ContactWriteSerializer(WriteSerializer):
         return attrs
 
     def validate_fields(self, attrs, source):
-        fields = attrs.get(source, {}).items()
+        fields = attrs.get(source, {})
         if fields:
             org_fields = self.context['contact_fields']
 
-            for key, value in attrs.get(source, {}).items():
-                for field in org_fields:
-                    # TODO get users to stop writing fields via labels
-                    if field.key == key or field.label == key:
-                        break
-                else:
+            # TODO get users to stop writing fields via labels
+            valid_keys = {f.key for f in org_fields} | {f.label for f in org_fields}
+
+            for key in fields.iterkeys():
+                if key not in valid_keys:
                     raise ValidationError("Invalid contact field key: '%s'" % key)
 
         return attrs
@@ -488,15 +562,7 @@ class ContactWriteSerializer(WriteSerializer):
     def validate_group_uuids(self, attrs, source):
         group_uuids = attrs.get(source, None)
         if group_uuids is not None:
-            groups = []
-            for uuid in group_uuids:
-                group = ContactGroup.user_groups.filter(uuid=uuid, org=self.org, is_active=True).first()
-                if not group:
-                    raise ValidationError(_("Unable to find contact group with uuid: %s") % uuid)
-
-                groups.append(group)
-
-            attrs['group_uuids'] = groups
+            attrs['group_uuids'] = self.get_groups_by_uuids(group_uuids)
         return attrs
 
     def restore_object(self, attrs, instance=None):
@@ -547,14 +613,21 @@ class ContactWriteSerializer(WriteSerializer):
         # update our fields
         fields = attrs.get('fields', None)
         if not fields is None:
+            # look up the org's active fields (already fetched for validation) by key and by label
+            fields_by_key = dict()
+            fields_by_label = dict()
+            for field in self.context['contact_fields']:
+                fields_by_key.setdefault(field.key.lower(), field)
+                fields_by_label.setdefault(field.label.lower(), field)
+
             for key, value in fields.items():
-                existing_by_key = ContactField.objects.filter(org=self.org, key__iexact=key, is_active=True).first()
+                existing_by_key = fields_by_key.get(key.lower())
                 if existing_by_key:
                     contact.set_field(existing_by_key.key, value)
                     continue
 
                 # TODO as above, need to get users to stop updating via label
-                existing_by_label = ContactField.get_by_label(self.org, key)
+                existing_by_label = fields_by_label.get(key.lower())
                 if existing_by_label:
                     contact.set_field(existing_by_label.key, value)
 
@@ -629,30 +702,22 @@ class ContactFieldWriteSerializer(WriteSerializer):
 
 
 class CampaignEventSerializer(serializers.ModelSerializer):
-    campaign_uuid = serializers.SerializerMethodField('get_campaign_uuid')
+    campaign_uuid = serializers.Field(source='campaign.uuid')
     flow_uuid = serializers.SerializerMethodField('get_flow_uuid')
-    relative_to = serializers.SerializerMethodField('get_relative_to')
-    event = serializers.SerializerMethodField('get_event')  # deprecated, use uuid
-    campaign = serializers.SerializerMethodField('get_campaign')  # deprecated, use campaign_uuid
+    relative_to = serializers.Field(source='relative_to.label')
+    event = serializers.Field(source='pk')  # deprecated, use uuid
+    campaign = serializers.Field(source='campaign_id')  # deprecated, use campaign_uuid
     flow = serializers.SerializerMethodField('get_flow')  # deprecated, use flow_uuid
 
-    def get_campaign_uuid(self, obj):
-        return obj.campaign.uuid
-
     def get_flow_uuid(self, obj):
         return obj.flow.uuid if obj.event_type == FLOW_EVENT else None
 
-    def get_campaign(self, obj):
-        return obj.campaign.pk
-
-    def get_event(self, obj):
-        return obj.pk
-
     def get_flow(self, obj):
         return obj.flow_id if obj.event_type == FLOW_EVENT else None
 
-    def get_relative_to(self, obj):
-        return obj.relative_to.label
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        return queryset.select_related('campaign', 'flow', 'relative_to')
 
     class Meta:
         model = CampaignEvent
@@ -756,10 +821,13 @@ class CampaignEventWriteSerializer(WriteSerializer):
         return attrs
 
     def validate(self, attrs):
-        if not (attrs.get('message', None) or attrs.get('flow_obj', None)):
+        message = attrs.get('message', None)
+        flow = attrs.get('flow_obj', None)
+
+        if not (message or flow):
             raise ValidationError("Must specify either a flow or a message for the event")
 
-        if attrs.get('message', None) and attrs.get('flow_obj', None):
+        if message and flow:
             raise ValidationError("Events cannot have both a message and a flow")
 
         if attrs.get('event_obj', None) and attrs.get('campaign_obj', None):
@@ -809,7 +877,7 @@ class CampaignEventWriteSerializer(WriteSerializer):
                 # otherwise, we can just update that flow
                 else:
                     # set our single message on our flow
-                    event.flow.update_single_message_flow(message=attrs['message'])
+                    event.flow.update_single_message_flow(message=message)
 
             # update our other attributes
             event.offset = offset
@@ -832,18 +900,13 @@ class CampaignEventWriteSerializer(WriteSerializer):
 
 
 class CampaignSerializer(serializers.ModelSerializer):
-    group_uuid = serializers.SerializerMethodField('get_group_uuid')
-    group = serializers.SerializerMethodField('get_group')  # deprecated, use group_uuid
-    campaign = serializers.SerializerMethodField('get_campaign')  # deprecated, use uuid
-
-    def get_group_uuid(self, obj):
-        return obj.group.uuid
+    group_uuid = serializers.Field(source='group.uuid')
+    group = serializers.Field(source='group.name')  # deprecated, use group_uuid
+    campaign = serializers.Field(source='pk')  # deprecated, use uuid
 
-    def get_campaign(self, obj):
-        return obj.pk
-
-    def get_group(self, obj):
-        return obj.group.name
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        return queryset.select_related('group')
 
     class Meta:
         model = Campaign
@@ -934,21 +997,32 @@ class FlowReadSerializer(serializers.ModelSerializer):
     participants = serializers.SerializerMethodField('get_participants')
     flow = serializers.Field(source='id')  # deprecated, use uuid
 
+    def get_run_stats(self, obj):
+        # all three run stats come from redis so fetch them together, once per flow
+        if not hasattr(obj, 'run_stats'):
+            obj.run_stats = obj.get_run_stats()
+        return obj.run_stats
+
     def get_runs(self, obj):
-        return obj.get_total_runs()
+        return self.get_run_stats(obj)['runs']
 
     def get_labels(self, obj):
         return [l.name for l in obj.labels.all()]
 
     def get_completed_runs(self, obj):
-        return obj.get_completed_runs()
+        return self.get_run_stats(obj)['completed_runs']
 
     def get_participants(self, obj):
-        return obj.get_total_contacts()
+        return self.get_run_stats(obj)['contacts']
 
     def get_rulesets(self, obj):
+        if hasattr(obj, 'prefetched_rulesets'):
+            obj_rulesets = obj.prefetched_rulesets
+        else:
+            obj_rulesets = obj.rule_sets.all().order_by('y')
+
         rulesets = list()
-        for ruleset in obj.rule_sets.all().order_by('y'):
+        for ruleset in obj_rulesets:
             rulesets.append(dict(node=ruleset.uuid,
                                  label=ruleset.label,
                                  response_type=ruleset.response_type,
@@ -956,6 +1030,15 @@ class FlowReadSerializer(serializers.ModelSerializer):
 
         return rulesets
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        rulesets_prefetch = Prefetch('rule_sets', queryset=RuleSet.objects.order_by('y'), to_attr='prefetched_rulesets')
+
+        # don't load flow metadata, we only need the org to look up run stats
+        queryset = queryset.only('org', 'uuid', 'name', 'is_archived', 'expires_after_minutes', 'created_on')
+
+        return queryset.prefetch_related('labels', rulesets_prefetch)
+
     class Meta:
         model = Flow
         fields = ('uuid', 'archived', 'expires', 'name', 'labels', 'participants', 'runs', 'completed_runs', 'rulesets',
@@ -1050,43 +1133,19 @@ class FlowRunStartSerializer(WriteSerializer):
         return attrs
 
     def validate_groups(self, attrs, source):
-        groups = []
-        for uuid in attrs.get(source, []):
-            group = ContactGroup.user_groups.filter(uuid=uuid, org=self.org, is_active=True).first()
-            if not group:
-                raise ValidationError(_("Unable to find contact group with uuid: %s") % uuid)
-
-            groups.append(group)
-
-        attrs['groups'] = groups
+        attrs['groups'] = self.get_groups_by_uuids(attrs.get(source, []))
         return attrs
 
     def validate_contacts(self, attrs, source):
-        contacts = []
         uuids = attrs.get(source, [])
         if uuids:
-            for uuid in uuids:
-                contact = Contact.objects.filter(uuid=uuid, org=self.org, is_active=True).first()
-                if not contact:
-                    raise ValidationError(_("Unable to find contact with uuid: %s") % uuid)
-
-                contacts.append(contact)
-
-            attrs['contacts'] = contacts
+            attrs['contacts'] = self.get_contacts_by_uuids(uuids)
         return attrs
 
     def validate_contact(self, attrs, source):  # deprecated, use contacts
-        contacts = []
         uuids = attrs.get(source, [])
         if uuids:
-            for uuid in attrs.get(source, []):
-                contact = Contact.objects.filter(uuid=uuid, org=self.org, is_active=True).first()
-                if not contact:
-                    raise ValidationError(_("Unable to find contact with uuid: %s") % uuid)
-
-                contacts.append(contact)
-
-            attrs['contacts'] = contacts
+            attrs['contacts'] = self.get_contacts_by_uuids(uuids)
         return attrs
 
     def validate_phone(self, attrs, source):  # deprecated, use contacts
@@ -1096,16 +1155,13 @@ class FlowRunStartSerializer(WriteSerializer):
         numbers = attrs.get(source, [])
         if numbers:
             # get a channel
-            channel = self.org.get_send_channel(TEL_SCHEME)
+            channel = self.get_tel_sender()
 
             if channel:
                 # check our numbers for validity
+                country_code = channel.country.code
                 for tel, phone in numbers:
-                    try:
-                        normalized = phonenumbers.parse(phone, channel.country.code)
-                        if not phonenumbers.is_possible_number(normalized):
-                            raise ValidationError("Invalid phone number: '%s'" % phone)
-                    except:
+                    if not format_e164(phone, country_code):
                         raise ValidationError("Invalid phone number: '%s'" % phone)
             else:
                 raise ValidationError("You cannot start a flow for a phone number without a phone channel")
@@ -1131,11 +1187,8 @@ class FlowRunStartSerializer(WriteSerializer):
         # include contacts created/matched via deprecated phone field
         phone_urns = attrs.get('phone', [])
         if phone_urns:
-            channel = self.org.get_send_channel(TEL_SCHEME)
-            for urn in phone_urns:
-                # treat each URN as separate contact
-                contact = Contact.get_or_create(channel.org, self.user, urns=[urn])
-                contacts.append(contact)
+            # treat each URN as separate contact
+            contacts += Contact.get_or_create_by_urns(self.org, self.user, phone_urns)
 
         if contacts or groups:
             return flow.start(groups, contacts, restart_participants=restart_participants, extra=extra)
@@ -1144,18 +1197,26 @@ class FlowRunStartSerializer(WriteSerializer):
 
 
 class BoundarySerializer(serializers.ModelSerializer):
-    boundary = serializers.SerializerMethodField('get_boundary')
-    parent = serializers.SerializerMethodField('get_parent')
+    boundary = serializers.Field(source='osm_id')
+    parent = serializers.Field(source='parent.osm_id')
     geometry = serializers.SerializerMethodField('get_geometry')
 
-    def get_parent(self, obj):
-        return obj.parent.osm_id if obj.parent else None
-
     def get_geometry(self, obj):
-        return json.loads(obj.simplified_geometry.geojson)
+        # use the GeoJSON rendered by the database if we requested it
+        if hasattr(obj, 'geojson'):
+            geojson = obj.geojson
+        else:
+            geojson = obj.simplified_geometry.geojson if obj.simplified_geometry else None
 
-    def get_boundary(self, obj):
-        return obj.osm_id
+        return json.loads(geojson) if geojson else None
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        # have the database render simplified geometries as GeoJSON and don't load any geometries into GEOS
+        queryset = queryset.geojson(field_name='simplified_geometry')
+        queryset = queryset.defer('geometry', 'simplified_geometry', 'parent__geometry', 'parent__simplified_geometry')
+
+        return queryset.select_related('parent')
 
     class Meta:
         model = AdminBoundary
@@ -1164,28 +1225,36 @@ class BoundarySerializer(serializers.ModelSerializer):
 
 class FlowRunReadSerializer(serializers.ModelSerializer):
     run = serializers.Field(source='id')
-    flow_uuid = serializers.SerializerMethodField('get_flow_uuid')
+    flow_uuid = serializers.Field(source='flow.uuid')
     values = serializers.SerializerMethodField('get_values')
     steps = serializers.SerializerMethodField('get_steps')
-    contact = serializers.SerializerMethodField('get_contact_uuid')
-    completed = serializers.SerializerMethodField('is_completed')
+    contact = serializers.Field(source='contact.uuid')
+    completed = serializers.Field(source='is_completed')
     expires_on = serializers.Field(source='expires_on')
     expired_on = serializers.Field(source='expired_on')
-    flow = serializers.SerializerMethodField('get_flow')  # deprecated, use flow_uuid
-
-    def get_flow(self, obj):
-        return obj.flow_id
-
-    def get_flow_uuid(self, obj):
-        return obj.flow.uuid
-
-    def get_contact_uuid(self, obj):
-        return obj.contact.uuid
-
-    def is_completed(self, obj):
-        return obj.is_completed()
+    flow = serializers.Field(source='flow_id')  # deprecated, use flow_uuid
+
+    # fields which are expensive to generate and so can be left out by requesting only the ones needed
+    OPTIONAL_FIELDS = ('values', 'steps')
+
+    @classmethod
+    def get_excluded_fields(cls, context):
+        include = context.get('include')
+        if include is None:
+            return ()
+        return [field for field in cls.OPTIONAL_FIELDS if field not in include]
+
+    def get_fields(self):
+        fields = super(FlowRunReadSerializer, self).get_fields()
+        for field in self.get_excluded_fields(self.context):
+            del fields[field]
+        return fields
 
     def get_values(self, obj):
+        # use the values calculated for the whole page by the view if we have them
+        if hasattr(obj, 'result_values'):
+            return obj.result_values
+
         results = obj.flow.get_results(obj.contact, run=obj)
         if results:
             return results[0]['values']
@@ -1204,6 +1273,25 @@ class FlowRunReadSerializer(serializers.ModelSerializer):
 
         return steps
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        queryset = queryset.select_related('contact', 'flow')
+        excluded = cls.get_excluded_fields(context)
+
+        # values are calculated from steps so we need steps if either is included
+        if 'steps' not in excluded or 'values' not in excluded:
+            # steps read their text from their messages, so fetch those up front too
+            steps_prefetch = Prefetch('steps', queryset=FlowStep.objects.order_by('arrived_on').prefetch_related('messages'))
+            queryset = queryset.prefetch_related(steps_prefetch)
+
+        if 'values' not in excluded:
+            rulesets_prefetch = Prefetch('flow__rule_sets',
+                                         queryset=RuleSet.objects.exclude(label=None).order_by('pk'),
+                                         to_attr='ruleset_prefetch')
+            queryset = queryset.prefetch_related(rulesets_prefetch)
+
+        return queryset
+
     class Meta:
         model = FlowRun
         fields = ('flow_uuid', 'flow', 'run', 'contact', 'completed', 'values',
@@ -1228,6 +1316,17 @@ class BroadcastReadSerializer(serializers.ModelSerializer):
     def get_groups(self, obj):
         return [group.uuid for group in obj.groups.all()]
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        # only fetch what we need from each recipient
+        urns_prefetch = Prefetch('urns', queryset=ContactURN.objects.only('urn'))
+        contacts_prefetch = Prefetch('contacts', queryset=Contact.objects.only('uuid'))
+        groups_prefetch = Prefetch('groups', queryset=ContactGroup.all_groups.only('uuid'))
+
+        queryset = queryset.only('text', 'created_on', 'status')
+
+        return queryset.prefetch_related(urns_prefetch, contacts_prefetch, groups_prefetch)
+
     class Meta:
         model = Broadcast
         fields = ('id', 'urns', 'contacts', 'groups', 'text', 'created_on', 'status')
@@ -1247,7 +1346,7 @@ class BroadcastCreateSerializer(WriteSerializer):
 
     def validate_urns(self, attrs, source):
         # if we have tel URNs, we may need a country to normalize by
-        tel_sender = self.org.get_send_channel(TEL_SCHEME)
+        tel_sender = self.get_tel_sender()
         country = tel_sender.country if tel_sender else None
 
         urns = []
@@ -1266,25 +1365,11 @@ class BroadcastCreateSerializer(WriteSerializer):
         return attrs
 
     def validate_contacts(self, attrs, source):
-        contacts = []
-        for uuid in attrs.get(source, []):
-            contact = Contact.objects.filter(uuid=uuid, org=self.org, is_active=True).first()
-            if not contact:
-                raise ValidationError(_("Unable to find contact with uuid: %s") % uuid)
-            contacts.append(contact)
-
-        attrs[source] = contacts
+        attrs[source] = self.get_contacts_by_uuids(attrs.get(source, []))
         return attrs
 
     def validate_groups(self, attrs, source):
-        groups = []
-        for uuid in attrs.get(source, []):
-            group = ContactGroup.user_groups.filter(uuid=uuid, org=self.org, is_active=True).first()
-            if not group:
-                raise ValidationError(_("Unable to find contact group with uuid: %s") % uuid)
-            groups.append(group)
-
-        attrs[source] = groups
+        attrs[source] = self.get_groups_by_uuids(attrs.get(source, []))
         return attrs
 
     def validate_channel(self, attrs, source):
@@ -1307,11 +1392,10 @@ class BroadcastCreateSerializer(WriteSerializer):
 
         recipients = attrs.get('contacts') + attrs.get('groups')
 
-        for urn in attrs.get('urns'):
-            # create contacts for URNs if necessary
-            contact = Contact.get_or_create(self.org, self.user, urns=[urn])
-            contact_urn = contact.urn_objects[urn]
-            recipients.append(contact_urn)
+        # create contacts for URNs if necessary
+        urns = attrs.get('urns')
+        for urn, contact in zip(urns, Contact.get_or_create_by_urns(self.org, self.user, urns)):
+            recipients.append(contact.urn_objects[urn])
 
         # create the broadcast
         broadcast = Broadcast.create(self.org, self.user, attrs['text'],
@@ -1355,16 +1439,7 @@ class MsgCreateSerializer(WriteSerializer):
         return attrs
 
     def validate_contact(self, attrs, source):
-        contacts = []
-
-        for uuid in attrs.get(source, []):
-            contact = Contact.objects.filter(uuid=uuid, org=self.org, is_active=True).first()
-            if not contact:
-                raise ValidationError(_("Unable to find contact with uuid: %s") % uuid)
-
-            contacts.append(contact)
-
-        attrs['contact'] = contacts
+        attrs['contact'] = self.get_contacts_by_uuids(attrs.get(source, []))
         return attrs
 
     def validate_urn(self, attrs, source):
@@ -1391,13 +1466,9 @@ class MsgCreateSerializer(WriteSerializer):
 
         if 'channel' in attrs and attrs['channel']:
             # check our numbers for validity
-            country = attrs['channel'].country
+            country_code = attrs['channel'].country.code
             for tel, phone in attrs.get(source, []):
-                try:
-                    normalized = phonenumbers.parse(phone, country.code)
-                    if not phonenumbers.is_possible_number(normalized):
-                        raise ValidationError("Invalid phone number: '%s'" % phone)
-                except:
+                if not format_e164(phone, country_code):
                     raise ValidationError("Invalid phone number: '%s'" % phone)
         else:
             raise ValidationError("You must specify a valid channel")
@@ -1417,10 +1488,9 @@ class MsgCreateSerializer(WriteSerializer):
             urns = attrs.get('phone', [])
 
         channel = attrs['channel']
-        contacts = list()
-        for urn in urns:
-            # treat each urn as a separate contact
-            contacts.append(Contact.get_or_create(channel.org, self.user, urns=[urn]))
+
+        # treat each urn as a separate contact
+        contacts = Contact.get_or_create_by_urns(channel.org, self.user, urns) if urns else []
 
         # add any contacts specified by uuids
         uuid_contacts = attrs.get('contact', [])
@@ -1448,11 +1518,11 @@ class MsgCreateResultSerializer(serializers.ModelSerializer):
 
 
 class CallSerializer(serializers.ModelSerializer):
-    call = serializers.SerializerMethodField('get_call')
-    contact = serializers.SerializerMethodField('get_contact_uuid')
+    call = serializers.Field(source='pk')
+    contact = serializers.Field(source='contact.uuid')
     created_on = serializers.Field(source='time')
     phone = serializers.SerializerMethodField('get_phone')
-    relayer = serializers.SerializerMethodField('get_relayer')
+    relayer = serializers.Field(source='channel_id')
     relayer_phone = serializers.SerializerMethodField('get_relayer_phone')
 
     def get_relayer_phone(self, obj):
@@ -1461,20 +1531,12 @@ class CallSerializer(serializers.ModelSerializer):
         else:
             return None
 
-    def get_relayer(self, obj):
-        if obj.channel:
-            return obj.channel.pk
-        else:
-            return None
-
-    def get_contact_uuid(self, obj):
-        return obj.contact.uuid
-
     def get_phone(self, obj):
         return obj.contact.get_urn_display(org=obj.org, scheme=TEL_SCHEME, full=True)
 
-    def get_call(self, obj):
-        return obj.pk
+    @classmethod
+    def setup_eager_loading(cls, queryset, context):
+        return queryset.select_related('org', 'channel', 'contact')
 
     class Meta:
         model = Call
@@ -1482,21 +1544,17 @@ class CallSerializer(serializers.ModelSerializer):
 
 
 class ChannelReadSerializer(serializers.ModelSerializer):
-    relayer = serializers.SerializerMethodField('get_relayer')
-    phone = serializers.SerializerMethodField('get_phone')
+    relayer = serializers.Field(source='pk')
+    phone = serializers.Field(source='address')
     power_level = serializers.Field(source='get_last_power')
     power_status = serializers.Field(source='get_last_power_status')
     power_source = serializers.Field(source='get_last_power_source')
     network_type = serializers.Field(source='get_last_network_type')
     pending_message_count = serializers.SerializerMethodField('get_unsent_count')
 
-    def get_phone(self, obj):
-        return obj.address
-
-    def get_relayer(self, obj):
-        return obj.pk
-
     def get_unsent_count(self, obj):
+        if hasattr(obj, 'unsent_count'):
+            return obj.unsent_count
         return obj.get_unsent_messages().count()
 
     class Meta:
@@ -1531,15 +1589,11 @@ class ChannelClaimSerializer(WriteSerializer):
         if not channel:
             return attrs
 
-        try:
-            normalized = phonenumbers.parse(phone, attrs['channel'].country.code)
-            if not phonenumbers.is_possible_number(normalized):
-                raise ValidationError("Invalid phone number: '%s'" % phone)
-        except:  # pragma: no cover
+        normalized = format_e164(phone, channel.country.code)
+        if not normalized:
             raise ValidationError("Invalid phone number: '%s'" % phone)
 
-        phone = phonenumbers.format_number(normalized, phonenumbers.PhoneNumberFormat.E164)
-        attrs['phone'] = phone
+        attrs['phone'] = normalized
 
         return attrs
 
@@ -4,6 +4,7 @@ from __future__ import unicode_literals
 
 import calendar
 import json
+import phonenumbers
 import time
 import uuid
 import pytz
@@ -11,8 +12,11 @@ import xml.etree.ElementTree as ET
 
 from datetime import timedelta
 from django.conf import settings
+from django.contrib.gis.geos import MultiPolygon, Polygon
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.http import urlquote_plus
 from mock import patch
@@ -26,6 +30,7 @@ from temba.channels.models import Channel, ChannelLog, SyncEvent, SEND_URL, SEND
 from temba.channels.models import PLIVO, PLIVO_AUTH_ID, PLIVO_AUTH_TOKEN, PLIVO_APP_ID, TEMBA_HEADERS
 from temba.channels.models import API_ID, USERNAME, PASSWORD, CLICKATELL, SHAQODOON
 from temba.flows.models import Flow, FlowLabel, FlowRun, RuleSet
+from temba.locations.models import AdminBoundary
 from temba.msgs.models import Broadcast, Call, Msg, WIRED, FAILED, SENT, DELIVERED, ERRORED, INCOMING, CALL_IN_MISSED
 from temba.msgs.models import MSG_SENT_KEY, Label, VISIBLE, ARCHIVED, DELETED
 from temba.tests import MockResponse, TembaTest, AnonymousOrg
@@ -38,6 +43,7 @@ from urllib import urlencode
 from urlparse import parse_qs
 from .models import WebHookEvent, WebHookResult, SMS_RECEIVED
 from .serializers import DictionaryField, IntegerArrayField, StringArrayField, PhoneArrayField, ChannelField, FlowField
+from .serializers import format_e164
 
 
 class APITest(TembaTest):
@@ -257,6 +263,25 @@ class APITest(TembaTest):
         self.channel.save()
         self.assertRaises(ValidationError, channel_field.from_native, self.channel.pk)
 
+    def test_format_e164(self):
+        self.assertEqual(format_e164('+250788123123'), '+250788123123')
+        self.assertEqual(format_e164('0788123123', 'RW'), '+250788123123')
+
+        # repeated numbers are only parsed once
+        with patch.dict('temba.api.serializers._e164_cache', clear=True):
+            with patch('phonenumbers.parse', wraps=phonenumbers.parse) as mock_parse:
+                self.assertEqual(format_e164('0788123123', 'RW'), '+250788123123')
+                self.assertEqual(format_e164('0788123123', 'RW'), '+250788123123')  # from cache
+                mock_parse.assert_called_once_with('0788123123', 'RW')
+
+                # including those which aren't possible numbers
+                self.assertIsNone(format_e164('123', 'RW'))
+                self.assertIsNone(format_e164('123', 'RW'))
+                self.assertEqual(mock_parse.call_count, 2)
+
+        self.assertIsNone(format_e164('0788123123'))  # no country to parse local number with
+        self.assertIsNone(format_e164('123', 'RW'))  # not a possible number
+
     def test_api_flows(self):
         url = reverse('api.flows')
 
@@ -582,6 +607,20 @@ class APITest(TembaTest):
         self.assertEqual(response.json['results'][0]['completed'], False)
         self.assertEqual(response.json['results'][0]['expires_on'], datetime_to_json_date(run.expires_on))
         self.assertEqual(response.json['results'][0]['expired_on'], None)
+        self.assertIn('steps', response.json['results'][0])
+        self.assertIn('values', response.json['results'][0])
+
+        # only include values
+        response = self.fetchJSON(url, "run=%d&include=values" % run.pk)
+        self.assertResultCount(response, 1)
+        self.assertNotIn('steps', response.json['results'][0])
+        self.assertIn('values', response.json['results'][0])
+
+        # include neither
+        response = self.fetchJSON(url, "run=%d&include=" % run.pk)
+        self.assertNotIn('steps', response.json['results'][0])
+        self.assertNotIn('values', response.json['results'][0])
+        self.assertEqual(response.json['results'][0]['run'], run.pk)
 
         # filter by flow id (deprecated)
         response = self.fetchJSON(url, "flow=%d" % flow.pk)
@@ -630,6 +669,43 @@ class APITest(TembaTest):
         self.assertEquals(200, response.status_code)
         self.assertResultCount(response, 0)
 
+    def test_api_runs_values(self):
+        url = reverse('api.runs')
+        self.login(self.admin)
+
+        flow = self.get_flow('favorites')
+        frank = self.create_contact("Frank", "0788000001")
+        self.send_message(flow, "red", contact=frank)
+        self.send_message(flow, "primus", contact=frank)
+
+        # values can be requested without steps
+        response = self.fetchJSON(url, "flow_uuid=%s&include=values" % flow.uuid)
+        self.assertResultCount(response, 1)
+        self.assertNotIn('steps', response.json['results'][0])
+
+        values = response.json['results'][0]['values']
+        self.assertEqual([v['label'] for v in values], ["Color", "Beer"])
+        self.assertEqual([v['category'] for v in values], ["Red", "Primus"])
+        self.assertEqual([v['text'] for v in values], ["red", "primus"])
+
+        # and are the same as when steps are included too
+        response = self.fetchJSON(url, "flow_uuid=%s" % flow.uuid)
+        self.assertEqual(response.json['results'][0]['values'], values)
+
+        # the number of queries doesn't depend on the number of runs
+        with CaptureQueriesContext(connection) as captured:
+            self.fetchJSON(url, "flow_uuid=%s&include=values" % flow.uuid)
+
+        mary = self.create_contact("Mary", "0788000002")
+        self.send_message(flow, "green", contact=mary)
+        self.send_message(flow, "skol", contact=mary)
+
+        with self.assertNumQueries(len(captured)):
+            response = self.fetchJSON(url, "flow_uuid=%s&include=values" % flow.uuid)
+
+        self.assertResultCount(response, 2)
+        self.assertEqual([v['category'] for v in response.json['results'][0]['values']], ["Green", "Skol"])
+
     def test_api_channels(self):
         url = reverse('api.channels')
 
@@ -701,6 +777,14 @@ class APITest(TembaTest):
         self.assertJSON(response, 'name', 'Test Channel')
         self.assertJSON(response, 'name', 'Claimed Channel')
 
+        # queue an outgoing message on our first channel
+        contact = self.create_contact("Joe", number="+250788123456")
+        self.create_msg(direction='O', text="Hi", contact=contact, status='Q')
+
+        response = self.fetchJSON(url)
+        self.assertEqual({r['name']: r['pending_message_count'] for r in response.json['results']},
+                         {'Test Channel': 1, 'Claimed Channel': 0})
+
         # trying to do so again should be an error of not finding the channel
         response = self.postJSON(url, dict(claim_code="123123123", name="Claimed Channel", phone="250788123123"))
         self.assertEquals(400, response.status_code)
@@ -1270,6 +1354,14 @@ class APITest(TembaTest):
         self.assertEqual(response.json['results'][0]['broadcast'], msg1.broadcast.pk)
         self.assertEqual(response.json['results'][0]['text'], msg1.text)
         self.assertEqual(response.json['results'][0]['direction'], 'O')
+        self.assertEqual(response.json['results'][0]['contact'], contact.uuid)
+        self.assertEqual(response.json['results'][0]['urn'], 'tel:+250788123123')
+        self.assertEqual(response.json['results'][0]['status'], 'Q')
+        self.assertEqual(response.json['results'][0]['labels'], [])
+        self.assertEqual(response.json['results'][0]['archived'], False)
+        self.assertEqual(set(response.json['results'][0].keys()),
+                         {'id', 'broadcast', 'contact', 'urn', 'status', 'type', 'labels', 'relayer', 'direction',
+                          'archived', 'text', 'created_on', 'sent_on', 'delivered_on'})
 
         response = self.fetchJSON(url, "status=Q&before=2030-01-01T00:00:00.000&after=2010-01-01T00:00:00.000&phone=%%2B250788123123&channel=%d" % self.channel.pk)
         self.assertEquals(200, response.status_code)
@@ -1553,17 +1645,21 @@ class APITest(TembaTest):
         self.assertEquals(204, response.status_code)
         self.assertEqual(set(label.get_messages()), set())
 
+        self.assertEqual(0, self.org.get_folder_count(OrgFolder.msgs_archived))
+
         # archive all messages
         response = self.postJSON(url, dict(messages=[msg1.pk, msg2.pk, msg3.pk, msg4.pk], action='archive'))
         self.assertEquals(204, response.status_code)
         self.assertEqual(set(Msg.objects.filter(visibility=VISIBLE)), {msg4})  # ignored as is outgoing
         self.assertEqual(set(Msg.objects.filter(visibility=ARCHIVED)), {msg1, msg2, msg3})
+        self.assertEqual(3, self.org.get_folder_count(OrgFolder.msgs_archived))
 
         # un-archive message 1
         response = self.postJSON(url, dict(messages=[msg1.pk], action='unarchive'))
         self.assertEquals(204, response.status_code)
         self.assertEqual(set(Msg.objects.filter(visibility=VISIBLE)), {msg1, msg4})
         self.assertEqual(set(Msg.objects.filter(visibility=ARCHIVED)), {msg2, msg3})
+        self.assertEqual(2, self.org.get_folder_count(OrgFolder.msgs_archived))
 
         # delete messages 2 and 4
         response = self.postJSON(url, dict(messages=[msg2.pk], action='delete'))
@@ -1571,6 +1667,7 @@ class APITest(TembaTest):
         self.assertEqual(set(Msg.objects.filter(visibility=VISIBLE)), {msg1, msg4})  # 4 ignored as is outgoing
         self.assertEqual(set(Msg.objects.filter(visibility=ARCHIVED)), {msg3})
         self.assertEqual(set(Msg.objects.filter(visibility=DELETED)), {msg2})
+        self.assertEqual(1, self.org.get_folder_count(OrgFolder.msgs_archived))
 
         # can't un-archive a deleted message
         response = self.postJSON(url, dict(messages=[msg2.pk], action='unarchive'))
@@ -1747,6 +1844,57 @@ class APITest(TembaTest):
         response = self.fetchJSON(url, 'status=E,F')
         self.assertEqual([b['text'] for b in response.json['results']], ["Hello 3", "Hello 1"])
 
+    def test_api_boundaries(self):
+        url = reverse('api.boundaries')
+
+        # can't access, get 403
+        self.assert403(url)
+
+        # login as administrator
+        self.login(self.admin)
+
+        # give Kigali City a simplified geometry, other boundaries have none
+        kigali_city = AdminBoundary.objects.get(osm_id='1708283')
+        kigali_city.simplified_geometry = MultiPolygon(Polygon(((30.0, -2.0), (30.0, -1.9), (30.1, -1.9), (30.0, -2.0))))
+        kigali_city.save()
+
+        response = self.fetchJSON(url)
+        self.assertEqual(200, response.status_code)
+        self.assertResultCount(response, 7)
+
+        results = {result['boundary']: result for result in response.json['results']}
+
+        self.assertEqual(results['1708283']['name'], "Kigali City")
+        self.assertEqual(results['1708283']['level'], 1)
+        self.assertEqual(results['1708283']['parent'], '171496')
+        self.assertEqual(results['1708283']['geometry'],
+                         dict(type='MultiPolygon',
+                              coordinates=[[[[30.0, -2.0], [30.0, -1.9], [30.1, -1.9], [30.0, -2.0]]]]))
+
+        # boundaries without geometry, or without a parent, are still returned
+        self.assertIsNone(results['171496']['parent'])
+        self.assertIsNone(results['171496']['geometry'])
+        self.assertIsNone(results['1711131']['geometry'])
+
+        # the number of queries doesn't depend on the number of boundaries or their geometries
+        with CaptureQueriesContext(connection) as captured:
+            self.fetchJSON(url)
+
+        AdminBoundary.objects.create(osm_id='1711158', name='Nyarugenge', level=2, parent=kigali_city,
+                                     simplified_geometry=kigali_city.simplified_geometry)
+
+        with self.assertNumQueries(len(captured)):
+            response = self.fetchJSON(url)
+            self.assertResultCount(response, 8)
+
+        # an org without a country has no boundaries
+        self.org.country = None
+        self.org.save()
+
+        response = self.fetchJSON(url)
+        self.assertEqual(200, response.status_code)
+        self.assertResultCount(response, 0)
+
     def test_api_campaigns(self):
         url = reverse('api.campaigns')
 
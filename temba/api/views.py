@@ -8,7 +8,8 @@ from datetime import timedelta
 from django.conf import settings
 from django.core.cache import cache
 from django.core.paginator import Paginator
-from django.db.models import Q, Prefetch
+from django.db.models import Q
+from django.db.models.query import QuerySet
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.utils import timezone
 from django.views.generic import View
@@ -32,7 +33,7 @@ from temba.assets.views import handle_asset_request
 from temba.campaigns.models import Campaign, CampaignEvent
 from temba.channels.models import Channel
 from temba.contacts.models import Contact, ContactField, ContactGroup, TEL_SCHEME, USER_DEFINED_GROUP
-from temba.flows.models import Flow, FlowRun, FlowStep, RuleSet
+from temba.flows.models import Flow, FlowRun, RuleSet
 from temba.locations.models import AdminBoundary
 from temba.orgs.views import OrgPermsMixin
 from temba.msgs.models import Broadcast, Msg, Call, Label, ARCHIVED, VISIBLE, DELETED
@@ -453,6 +454,11 @@ class ListAPIMixin(mixins.ListModelMixin):
     paginator_class = FixedCountPaginator
 
     def paginate_queryset(self, queryset, page_size=None):
+        # let the serializer eager load whatever it needs for the objects it will serialize
+        serializer_class = self.get_serializer_class()
+        if isinstance(queryset, QuerySet) and hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset, self.get_serializer_context())
+
         if self.cache_counts:
             # total counts can be expensive so we let some views cache counts based on the query parameters
             query_params = self.request.QUERY_PARAMS.copy()
@@ -635,7 +641,7 @@ class BroadcastEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
             except:
                 queryset = queryset.filter(pk=-1)
 
-        return queryset.order_by('-created_on').prefetch_related('urns', 'contacts', 'groups')
+        return queryset.order_by('-created_on')
 
     @classmethod
     def get_read_explorer(cls):
@@ -860,7 +866,6 @@ class MessageEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
         reverse_order = self.request.QUERY_PARAMS.get('reverse', None)
         order = 'created_on' if reverse_order and str_to_bool(reverse_order) else '-created_on'
 
-        queryset = queryset.select_related('org', 'contact', 'contact_urn').prefetch_related('labels')
         return queryset.order_by(order).distinct()
 
     @classmethod
@@ -1185,6 +1190,16 @@ class CallEndpoint(ListAPIMixin, BaseAPIView):
 
         return queryset
 
+    def prepare_for_serialization(self, object_list):
+        # calls from the same contact should share a contact object so it only needs its URNs fetched once
+        contacts_by_id = dict()
+        for call in object_list:
+            call.contact = contacts_by_id.setdefault(call.contact_id, call.contact)
+
+        # initialize caches of all URNs used for contact phone numbers
+        if not self.request.user.get_org().is_anon:
+            Contact.bulk_urn_cache_initialize(contacts_by_id.values())
+
     @classmethod
     def get_read_explorer(cls):
         spec = dict(method="GET",
@@ -1351,6 +1366,12 @@ class ChannelEndpoint(ListAPIMixin, CreateAPIMixin, DeleteAPIMixin, BaseAPIView)
 
         return queryset
 
+    def prepare_for_serialization(self, object_list):
+        # count unsent messages for all channels at once rather than one query per channel
+        unsent_counts = Channel.get_unsent_message_counts(object_list)
+        for channel in object_list:
+            channel.unsent_count = unsent_counts.get(channel.pk, 0)
+
     @classmethod
     def get_read_explorer(cls):
         spec = dict(method="GET",
@@ -1626,10 +1647,7 @@ class ContactEndpoint(ListAPIMixin, CreateAPIMixin, DeleteAPIMixin, BaseAPIView)
         if uuids:
             queryset = queryset.filter(uuid__in=uuids)
 
-        # can't prefetch a custom manager directly, so here we prefetch user groups as new attribute
-        user_groups_prefetch = Prefetch('all_groups', queryset=ContactGroup.user_groups.all(), to_attr='prefetched_user_groups')
-
-        return queryset.select_related('org').prefetch_related(user_groups_prefetch).order_by('modified_on')
+        return queryset.order_by('modified_on')
 
     def prepare_for_serialization(self, object_list):
         # initialize caches of all contact fields and URNs
@@ -1638,10 +1656,13 @@ class ContactEndpoint(ListAPIMixin, CreateAPIMixin, DeleteAPIMixin, BaseAPIView)
 
     def get_serializer_context(self):
         """
-        So that we only fetch active contact fields once for all contacts
+        So that we only fetch active contact fields and org languages once for all contacts
         """
+        org = self.request.user.get_org()
+
         context = super(BaseAPIView, self).get_serializer_context()
-        context['contact_fields'] = ContactField.objects.filter(org=self.request.user.get_org(), is_active=True)
+        context['contact_fields'] = ContactField.objects.filter(org=org, is_active=True)
+        context['languages'] = org.languages.all()
         return context
 
     @classmethod
@@ -1941,6 +1962,10 @@ class FlowRunEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
     * **steps** - steps visited by the contact on the flow (array of dictionaries)
     * **values** - values collected during the flow run (array of dictionaries)
 
+    Steps and values are the most expensive parts of a run to fetch, so if you only need one of them or neither, you
+    can list the ones you want with the ```include``` parameter, e.g. ```include=values``` or ```include=``` for neither.
+    Both are included if this parameter isn't given.
+
     Example:
 
         GET /api/v1/runs.json?flow_uuid=f5901b62-ba76-4003-9c62-72fdacc1b7b7
@@ -2061,6 +2086,14 @@ class FlowRunEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
                                                "use restart_participants to force them to restart in the flow"]),
                         status=status.HTTP_400_BAD_REQUEST)
 
+    def get_serializer_context(self):
+        context = super(FlowRunEndpoint, self).get_serializer_context()
+
+        # which of the optional steps and values fields to include, defaulting to both
+        if 'include' in self.request.QUERY_PARAMS:
+            context['include'] = [f for f in splitting_getlist(self.request, 'include') if f]
+        return context
+
     def get_queryset(self):
         queryset = self.model.objects.filter(flow__org=self.request.user.get_org(), contact__is_test=False)
 
@@ -2110,13 +2143,22 @@ class FlowRunEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
         if contacts:
             queryset = queryset.filter(contact__uuid__in=contacts)
 
-        steps_prefetch = Prefetch('steps', queryset=FlowStep.objects.order_by('arrived_on'))
+        return queryset.order_by('-created_on')
 
-        rulesets_prefetch = Prefetch('flow__rule_sets',
-                                     queryset=RuleSet.objects.exclude(label=None).order_by('pk'),
-                                     to_attr='ruleset_prefetch')
+    def prepare_for_serialization(self, object_list):
+        if 'values' in FlowRunReadSerializer.get_excluded_fields(self.get_serializer_context()):
+            return
+
+        # build the ruleset caches for each flow once rather than for every run of that flow
+        ruleset_caches_by_flow = dict()
+        for run in object_list:
+            ruleset_caches = ruleset_caches_by_flow.get(run.flow_id)
+            if ruleset_caches is None:
+                ruleset_caches = run.flow.build_ruleset_caches(getattr(run.flow, 'ruleset_prefetch', None))
+                ruleset_caches_by_flow[run.flow_id] = ruleset_caches
 
-        return queryset.select_related('contact', 'flow').prefetch_related(steps_prefetch, rulesets_prefetch).order_by('-created_on')
+            results = run.flow.get_results(run.contact, run=run, ruleset_caches=ruleset_caches)
+            run.result_values = results[0]['values'] if results else []
 
     @classmethod
     def get_read_explorer(cls):
@@ -2133,6 +2175,8 @@ class FlowRunEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
                                help="One or more contact UUIDs to filter by. (repeatable) ex: 09d23a05-47fe-11e4-bfe9-b8f6b119e9ab"),
                           dict(name='group_uuids', required=False,
                                help="One or more group UUIDs to filter by.(repeatable)  ex: 6685e933-26e1-4363-a468-8f7268ab63a9"),
+                          dict(name='include', required=False,
+                               help="Which of steps and values to include, defaults to both. ex: values"),
                           dict(name='before', required=False,
                                help="Only return runs which were created before this date.  ex: 2012-01-28T18:00:00.000"),
                           dict(name='after', required=False,
@@ -2250,7 +2294,7 @@ class CampaignEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
             except:
                 queryset = queryset.filter(pk=-1)
 
-        return queryset.select_related('group').order_by('-created_on')
+        return queryset.order_by('-created_on')
 
     @classmethod
     def get_read_explorer(cls):
@@ -2424,7 +2468,7 @@ class CampaignEventEndpoint(ListAPIMixin, CreateAPIMixin, DeleteAPIMixin, BaseAP
             except:
                 queryset = queryset.filter(pk=-1)
 
-        return queryset.select_related('campaign', 'flow').order_by('-created_on')
+        return queryset.order_by('-created_on')
 
     @classmethod
     def get_read_explorer(cls):
@@ -2553,7 +2597,7 @@ class BoundaryEndpoint(ListAPIMixin, BaseAPIView):
         queryset = self.model.objects.filter(Q(pk=org.country.pk) |
                                              Q(parent=org.country) |
                                              Q(parent__parent=org.country)).order_by('level', 'name')
-        return queryset.select_related('parent')
+        return queryset
 
     @classmethod
     def get_read_explorer(cls):
@@ -2665,7 +2709,7 @@ class FlowEndpoint(ListAPIMixin, CreateAPIMixin, BaseAPIView):
         if archived is not None:
             queryset = queryset.filter(is_archived=str_to_bool(archived))
 
-        return queryset.prefetch_related('labels')
+        return queryset
 
     @classmethod
     def get_read_explorer(cls):
@@ -11,7 +11,7 @@ from datetime import timedelta
 from django.contrib.auth.models import User, Group
 from django.core.urlresolvers import reverse
 from django.db import models
-from django.db.models import Q, Max
+from django.db.models import Q, Max, Count
 from django.db.models.signals import pre_save
 from django.conf import settings
 from django.utils import timezone
@@ -661,14 +661,33 @@ class Channel(SmartModel):
         last = self.get_last_sync()
         return last.network_type if last else None
 
-    def get_unsent_messages(self):
+    @classmethod
+    def get_all_unsent_messages(cls):
+        """
+        Gets the unsent messages across all channels
+        """
+        from temba.msgs.models import Msg
+
         # all message states that are incomplete
-        messages = self.msgs.filter(status__in=['P', 'Q'])
+        messages = Msg.objects.filter(status__in=['P', 'Q'])
 
         # only outgoing messages on real contacts
         messages = messages.filter(direction='O', contact__is_test=False)
         return messages
 
+    def get_unsent_messages(self):
+        return self.get_all_unsent_messages().filter(channel=self)
+
+    @classmethod
+    def get_unsent_message_counts(cls, channels):
+        """
+        Gets the number of unsent messages for each of the given channels with a single query, as a dict of channel id
+        to count. Channels without unsent messages are omitted.
+        """
+        messages = cls.get_all_unsent_messages().filter(channel__in=channels)
+        counts = messages.values('channel').annotate(count=Count('pk')).order_by()
+        return {c['channel']: c['count'] for c in counts}
+
     def is_new(self):
         # is this channel newer than an hour
         return self.created_on > timezone.now() - timedelta(hours=1) or not self.get_last_sync()
@@ -34,6 +34,14 @@ OLD_TEST_CONTACT_TEL = '+12065551212'
 START_TEST_CONTACT_PATH = 12065550100
 END_TEST_CONTACT_PATH = 12065550199
 
+# patterns for making and validating field keys and URNs, compiled once as these are used for every contact written
+FIELD_KEY_INVALID_CHARS_REGEX = re.compile(r'([^a-z0-9]+)')
+FIELD_LABEL_VALID_REGEX = re.compile(r'^[A-Za-z0-9\- ]+$')
+FIELD_LABEL_CHARS_REGEX = re.compile(r'([A-Za-z0-9\- ]+)')
+TWITTER_HANDLE_REGEX = re.compile(r'^[a-zA-Z0-9_]{1,15}$')
+NUMBER_INVALID_CHARS_REGEX = re.compile(r'[^0-9a-z\+]')
+LOCAL_NUMBER_INVALID_CHARS_REGEX = re.compile(r'[^0-9a-z]')
+
 
 
 class ContactField(models.Model, OrgModelMixin):
@@ -54,8 +62,8 @@ class ContactField(models.Model, OrgModelMixin):
 
     @classmethod
     def make_key(cls, label):
-        key = re.sub(r'([^a-z0-9]+)', ' ', label.lower())
-        return re.sub(r'([^a-z0-9]+)', '_', key.strip())
+        key = FIELD_KEY_INVALID_CHARS_REGEX.sub(' ', label.lower())
+        return FIELD_KEY_INVALID_CHARS_REGEX.sub('_', key.strip())
 
     @classmethod
     def api_make_key(cls, label):
@@ -68,7 +76,7 @@ class ContactField(models.Model, OrgModelMixin):
 
     @classmethod
     def is_valid_label(cls, label):
-        return re.match(r'^[A-Za-z0-9\- ]+$', label)
+        return FIELD_LABEL_VALID_REGEX.match(label)
 
     @classmethod
     def hide_field(cls, org, key):
@@ -125,7 +133,7 @@ class ContactField(models.Model, OrgModelMixin):
             else:
                 # we need to create a new contact field, use our key with invalid chars removed
                 if not label:
-                    label = re.sub(r'([A-Za-z0-9\- ]+)', ' ', key).title()
+                    label = FIELD_LABEL_CHARS_REGEX.sub(' ', key).title()
 
                 if not value_type:
                     value_type = TEXT
@@ -491,6 +499,131 @@ class Contact(TembaModel, SmartModel, OrgModelMixin):
         contact.handle_update(attrs=updated_attrs.keys(), urns=updated_urns)
         return contact
 
+    @classmethod
+    def get_or_create_by_urns(cls, org, user, urns):
+        """
+        Gets or creates a separate contact for each of the given URNs. Existing URNs are looked up with a single query
+        and contacts for the remaining URNs are created in bulk. Returns the contacts in the same order as the URNs.
+        """
+        if not urns:
+            return []
+
+        receiver = org.get_receive_channel(TEL_SCHEME)
+        country = receiver.country if receiver else None
+
+        normalized = dict()
+        for scheme, path in urns:
+            if not scheme or not path:
+                raise ValueError(_("URN cannot have empty scheme or path"))
+
+            norm_scheme, norm_path = ContactURN.normalize_urn(scheme, path, country)
+            normalized[(scheme, path)] = (norm_scheme, norm_path, ContactURN.format_urn(norm_scheme, norm_path))
+
+        def get_existing_urns(norm_urns):
+            existing = ContactURN.objects.filter(org=org, urn__in=norm_urns).select_related('contact')
+            return {u.urn: u for u in existing}
+
+        existing_by_urn = get_existing_urns([n[2] for n in normalized.values()])
+
+        # URNs which exist and have a contact don't need a lock as this is read only
+        missing = []
+        for urn in urns:
+            existing_urn = existing_by_urn.get(normalized[urn][2])
+            if not (existing_urn and existing_urn.contact):
+                missing.append(normalized[urn])
+
+        created = []
+        if missing:
+            # perform creation in an org-level lock to prevent duplication by different instances
+            with org.lock_on(OrgLock.contacts):
+                existing_by_urn.update(get_existing_urns([n[2] for n in missing]))
+
+                # each distinct URN still without a contact gets a new contact
+                to_create = list()
+                to_create_urns = set()
+                for norm_scheme, norm_path, norm_urn in missing:
+                    existing_urn = existing_by_urn.get(norm_urn)
+                    if not (existing_urn and existing_urn.contact) and norm_urn not in to_create_urns:
+                        to_create.append((norm_scheme, norm_path, norm_urn))
+                        to_create_urns.add(norm_urn)
+
+                if to_create:
+                    created = cls._bulk_create_for_urns(org, user, to_create, existing_by_urn)
+
+        if created:
+            # record contact creation in analytics
+            for contact in created:
+                urn = contact.get_urns()[0]
+                analytics.track(user.username, 'temba.contact_created', {'name': None, '%s1' % urn.scheme: urn.path})
+
+            # handle group and campaign updates for all the new contacts at once
+            ContactGroup.update_groups_for_contacts(org, created)
+
+        contacts = []
+        contacts_by_urn = dict()
+        for urn in urns:
+            norm_urn = normalized[urn][2]
+            existing_urn = existing_by_urn[norm_urn]
+
+            # same URN should get the same contact object, mapping all of the URNs requested for it
+            contact = contacts_by_urn.get(norm_urn)
+            if not contact:
+                contact = existing_urn.contact
+                contact.urn_objects = dict()
+                contacts_by_urn[norm_urn] = contact
+
+            contact.urn_objects[urn] = existing_urn
+            contacts.append(contact)
+
+        return contacts
+
+    @classmethod
+    def _bulk_create_for_urns(cls, org, user, urns, existing_by_urn):
+        """
+        Creates a new contact for each of the given normalized URNs, using bulk inserts for the contacts and any new URN
+        objects. Orphaned URNs in existing_by_urn are attached to their new contacts, and new URN objects are added.
+        Returns the new contacts.
+        """
+        new_contacts = [Contact(org=org, created_by=user, modified_by=user) for u in urns]
+        cls.objects.bulk_create(new_contacts)
+
+        # bulk_create doesn't give us ids so re-fetch our new contacts by their UUIDs
+        contacts_by_uuid = {c.uuid: c for c in cls.objects.filter(uuid__in=[c.uuid for c in new_contacts])}
+        new_contacts = [contacts_by_uuid[c.uuid] for c in new_contacts]
+
+        # add them to our All Contacts group
+        ContactGroup.system_groups.get(org=org, group_type=ALL_CONTACTS_GROUP).contacts.add(*new_contacts)
+
+        urns_to_create = list()
+        for contact, (norm_scheme, norm_path, norm_urn) in zip(new_contacts, urns):
+            orphan_urn = existing_by_urn.get(norm_urn)
+            if orphan_urn:
+                ContactURN.objects.filter(pk=orphan_urn.pk).update(contact=contact)
+                orphan_urn.contact = contact
+            else:
+                priority = URN_SCHEME_PRIORITIES.get(norm_scheme, STANDARD_PRIORITY)
+                urns_to_create.append(ContactURN(org=org, contact=contact, priority=priority,
+                                                 scheme=norm_scheme, path=norm_path, urn=norm_urn))
+
+        if urns_to_create:
+            ContactURN.objects.bulk_create(urns_to_create)
+            existing_by_urn.update(
+                {u.urn: u for u in ContactURN.objects.filter(org=org, urn__in=[u.urn for u in urns_to_create])})
+
+        for contact, (norm_scheme, norm_path, norm_urn) in zip(new_contacts, urns):
+            contact_urn = existing_by_urn[norm_urn]
+            contact_urn.contact = contact
+
+            # each new contact only has this URN so initialize its URN cache with that
+            setattr(contact, '__urns', [contact_urn])
+
+            org.update_caches(OrgEvent.contact_new, contact)
+
+            # add attribute which allows callers to track new vs existing
+            contact.is_new = True
+
+        return new_contacts
+
     @classmethod
     def get_test_contact(cls, user):
         org = user.get_org()
@@ -882,10 +1015,7 @@ class Contact(TembaModel, SmartModel, OrgModelMixin):
         # build id maps to avoid re-fetching contact objects
         key_map = {f.id: f.key for f in fields}
 
-        contact_map = dict()
-        for contact in contacts:
-            contact_map[contact.id] = contact
-            setattr(contact, '__urns', list())  # initialize URN list cache (setattr avoids name mangling or __urns)
+        contact_map = {contact.id: contact for contact in contacts}
 
         # cache all field values
         values = Value.objects.filter(contact__in=contact_map.keys(),
@@ -903,6 +1033,18 @@ class Contact(TembaModel, SmartModel, OrgModelMixin):
                 if not hasattr(contact, cache_attr):
                     setattr(contact, cache_attr, None)
 
+        cls.bulk_urn_cache_initialize(contacts)
+
+    @classmethod
+    def bulk_urn_cache_initialize(cls, contacts):
+        """
+        Initializes the URN caches of the given contacts, so that get_urns and its dependents don't need to hit the db
+        """
+        contact_map = dict()
+        for contact in contacts:
+            contact_map[contact.id] = contact
+            setattr(contact, '__urns', list())  # initialize URN list cache (setattr avoids name mangling or __urns)
+
         # cache all URN values (a priority ordered list on each contact)
         urns = ContactURN.objects.filter(contact__in=contact_map.keys()).order_by('contact', '-priority', 'pk')
         for urn in urns:
@@ -1209,7 +1351,7 @@ class ContactURN(models.Model):
 
             return True  # if we don't have a channel with country, we can't for now validate tel numbers
         elif scheme == TWITTER_SCHEME:
-            return re.match(r'^[a-zA-Z0-9_]{1,15}$', path)
+            return TWITTER_HANDLE_REGEX.match(path)
         else:
             return False  # only tel and twitter currently supported
 
@@ -1243,7 +1385,7 @@ class ContactURN(models.Model):
             number = number[0:-4].replace('.', '')
 
         # remove other characters
-        number = re.sub('[^0-9a-z\+]', '', number.lower())
+        number = NUMBER_INVALID_CHARS_REGEX.sub('', number.lower())
 
         # add on a plus if it looks like it could be a fully qualified number
         if len(number) > 11 and number[0] != '+':
@@ -1263,7 +1405,7 @@ class ContactURN(models.Model):
             pass
 
         # this must be a local number of some kind, just lowercase and save
-        return re.sub('[^0-9a-z]', '', number.lower()), False
+        return LOCAL_NUMBER_INVALID_CHARS_REGEX.sub('', number.lower()), False
 
     def ensure_number_normalization(self, channel):
         """
@@ -1464,6 +1606,41 @@ class ContactGroup(TembaModel, SmartModel):
 
         return group_change
 
+    @classmethod
+    def update_groups_for_contacts(cls, org, contacts):
+        """
+        Bulk version of update_groups_for_contact which re-evaluates each dynamic group once for all of the given
+        contacts, and updates the campaign events of those whose membership changed. Returns the ids of those contacts.
+        """
+        from temba.campaigns.models import EventFire
+
+        contacts_by_id = {c.pk: c for c in contacts}
+        changed = set()
+
+        for group in ContactGroup.user_groups.filter(org=org, is_active=True).exclude(query=None):
+            qs, is_complex = Contact.search(org, group.query)  # re-run group query
+            qualifying = set(qs.filter(pk__in=contacts_by_id.keys()).values_list('pk', flat=True))
+            members = set(group.contacts.filter(pk__in=contacts_by_id.keys()).values_list('pk', flat=True))
+
+            to_add = qualifying - members
+            to_remove = members - qualifying
+
+            if to_add:
+                group.contacts.add(*[contacts_by_id[pk] for pk in to_add])
+            if to_remove:
+                group.contacts.remove(*[contacts_by_id[pk] for pk in to_remove])
+
+            # invalidate our result cache for anybody depending on this group if it changed
+            if to_add or to_remove:
+                Value.invalidate_cache(group=group)
+                changed.update(to_add, to_remove)
+
+        # ensure campaigns are up to date for contacts whose groups changed
+        for contact_id in changed:
+            EventFire.update_events_for_contact(contacts_by_id[contact_id])
+
+        return changed
+
     def get_member_count(self):
         """
         Returns the number of active and non-test contacts in the group
@@ -16,7 +16,7 @@ from smartmin.tests import _CRUDLTest
 from smartmin.csv_imports.models import ImportTask
 from temba.contacts.models import Contact, ContactGroup, ContactField, ContactURN, TEL_SCHEME, TWITTER_SCHEME, \
     URN_SCHEME_CHOICES
-from temba.contacts.models import ExportContactsTask
+from temba.contacts.models import ExportContactsTask, ALL_CONTACTS_GROUP
 from temba.contacts.templatetags.contacts import contact_field
 from temba.locations.models import AdminBoundary
 from temba.orgs.models import Org, OrgFolder
@@ -275,6 +275,22 @@ class ContactGroupTest(TembaTest):
         response = self.client.get(filter_url)
         self.assertFalse('unlabel' in response.context['actions'])
 
+    def test_update_groups_for_contacts(self):
+        group = ContactGroup.create(self.org, self.admin, "Joes")
+        group.update_query('name has joe')
+        self.assertEqual(set(group.contacts.all()), {self.joe})
+
+        # rename contacts without updating their groups
+        Contact.objects.filter(pk=self.joe.pk).update(name="Joseph")
+        Contact.objects.filter(pk=self.mary.pk).update(name="Mary Joe")
+
+        changed = ContactGroup.update_groups_for_contacts(self.org, [self.joe, self.frank, self.mary])
+        self.assertEqual(changed, {self.joe.pk, self.mary.pk})
+        self.assertEqual(set(group.contacts.all()), {self.mary})
+
+        # nothing changes if re-evaluated again
+        self.assertEqual(ContactGroup.update_groups_for_contacts(self.org, [self.joe, self.mary]), set())
+
     def test_delete(self):
         group = ContactGroup.create(self.org, self.user, "one")
 
@@ -1205,6 +1221,39 @@ class ContactTest(TembaTest):
         self.assertRaises(ValueError, contact5.update_urns, [(TEL_SCHEME, '0788333444')])
         self.assertEquals(contact4, ContactURN.objects.get(urn='tel:+250788333444').contact)
 
+    def test_get_or_create_by_urns(self):
+        # no URNs means nothing to look up
+        with self.assertNumQueries(0):
+            self.assertEqual(Contact.get_or_create_by_urns(self.org, self.admin, []), [])
+
+        contacts = Contact.get_or_create_by_urns(self.org, self.admin, [(TEL_SCHEME, '123'),
+                                                                        (TWITTER_SCHEME, 'blow80'),
+                                                                        (TEL_SCHEME, '8888'),
+                                                                        (TEL_SCHEME, '5555')])
+
+        # existing URNs map to their contacts, orphaned and new URNs get new contacts
+        self.assertEqual(contacts[0], self.joe)
+        self.assertEqual(contacts[1], self.joe)
+        self.assertEqual(contacts[2], Contact.from_urn(self.org, TEL_SCHEME, '8888'))
+        self.assertEqual(contacts[3], Contact.from_urn(self.org, TEL_SCHEME, '5555'))
+        self.assertEqual(len({c.pk for c in contacts}), 3)
+
+        # and each contact maps the requested URN to its URN object
+        self.assertEqual(contacts[0].urn_objects[(TEL_SCHEME, '123')].urn, 'tel:123')
+        self.assertEqual(contacts[3].urn_objects[(TEL_SCHEME, '5555')].urn, 'tel:5555')
+
+        # new contacts are flagged as new and added to the All Contacts group
+        self.assertFalse(getattr(contacts[0], 'is_new', False))
+        self.assertTrue(contacts[2].is_new)
+        self.assertTrue(contacts[3].is_new)
+        all_contacts = ContactGroup.system_groups.get(org=self.org, group_type=ALL_CONTACTS_GROUP)
+        self.assertTrue(all_contacts.contacts.filter(pk=contacts[3].pk).exists())
+
+        # a URN requested twice gets one contact
+        contacts = Contact.get_or_create_by_urns(self.org, self.admin, [(TEL_SCHEME, '7777'), (TEL_SCHEME, '7777')])
+        self.assertEqual(contacts[0], contacts[1])
+        self.assertEqual(ContactURN.objects.filter(org=self.org, urn='tel:7777').count(), 1)
+
     def test_from_urn(self):
         self.assertEqual(self.joe, Contact.from_urn(self.org, 'tel', '123'))  # URN with contact
         self.assertIsNone(Contact.from_urn(self.org, 'tel', '8888'))  # URN with no contact
@@ -953,6 +953,21 @@ class Flow(TembaModel, SmartModel):
         r = get_redis_connection()
         return r.scard(self.get_stats_cache_key(FlowStatsCache.contacts_started_set))
 
+    def get_run_stats(self):
+        """
+        Gets the total runs, completed runs and total contacts for this flow with a single trip to redis
+        """
+        self._check_for_cache_update()
+        r = get_redis_connection()
+
+        pipe = r.pipeline()
+        pipe.get(self.get_stats_cache_key(FlowStatsCache.runs_started_count))
+        pipe.scard(self.get_stats_cache_key(FlowStatsCache.runs_completed_count))
+        pipe.scard(self.get_stats_cache_key(FlowStatsCache.contacts_started_set))
+        runs, completed_runs, contacts = pipe.execute()
+
+        return dict(runs=int(runs) if runs else 0, completed_runs=completed_runs, contacts=contacts)
+
     def update_start_counts(self, contacts, simulation=False):
         """
         Track who and how many people just started our flow
@@ -1169,7 +1184,7 @@ class Flow(TembaModel, SmartModel):
         rulesets = dict()
         rule_categories = dict()
 
-        if not ruleset_list:
+        if ruleset_list is None:
             ruleset_list = RuleSet.objects.filter(flow=self).exclude(label=None).order_by('pk').select_related('flow', 'flow__org')
 
         for ruleset in ruleset_list:
@@ -1239,15 +1254,18 @@ class Flow(TembaModel, SmartModel):
 
         return context
 
-    def get_results(self, contact=None, filter_ruleset=None, only_last_run=True, run=None):
-        if filter_ruleset:
-            ruleset_list = [filter_ruleset]
-        elif run and hasattr(run.flow, 'ruleset_prefetch'):
-            ruleset_list = run.flow.ruleset_prefetch
+    def get_results(self, contact=None, filter_ruleset=None, only_last_run=True, run=None, ruleset_caches=None):
+        if ruleset_caches:
+            (rulesets, rule_categories) = ruleset_caches
         else:
-            ruleset_list = None
+            if filter_ruleset:
+                ruleset_list = [filter_ruleset]
+            elif run and hasattr(run.flow, 'ruleset_prefetch'):
+                ruleset_list = run.flow.ruleset_prefetch
+            else:
+                ruleset_list = None
 
-        (rulesets, rule_categories) = self.build_ruleset_caches(ruleset_list)
+            (rulesets, rule_categories) = self.build_ruleset_caches(ruleset_list)
 
         # for each of the contacts that participated
         results = []
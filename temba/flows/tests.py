@@ -2381,6 +2381,7 @@ class FlowsTest(FlowFileTest):
         # half of our flows are now complete
         self.assertEquals(1, flow.get_completed_runs())
         self.assertEquals(50, flow.get_completed_percentage())
+        self.assertEquals(dict(runs=2, completed_runs=1, contacts=2), flow.get_run_stats())
 
         # rebuild our flow stats and make sure they are the same
         flow.do_calculate_flow_stats()
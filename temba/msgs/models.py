@@ -1261,6 +1261,38 @@ class Msg(models.Model, OrgModelMixin):
             # remove labels
             self.labels.clear()
 
+    @classmethod
+    def bulk_archive(cls, msgs):
+        """
+        Archives all the visible incoming messages in the given queryset
+        """
+        return cls._bulk_update_state(msgs.filter(direction=INCOMING), dict(visibility=VISIBLE),
+                                      dict(visibility=ARCHIVED), OrgEvent.msg_archived)
+
+    @classmethod
+    def bulk_restore(cls, msgs):
+        """
+        Restores (i.e. un-archives) all the archived messages in the given queryset
+        """
+        return cls._bulk_update_state(msgs, dict(visibility=ARCHIVED), dict(visibility=VISIBLE),
+                                      OrgEvent.msg_restored)
+
+    @classmethod
+    def bulk_release(cls, msgs):
+        """
+        Releases (i.e. deletes) all the non-deleted messages in the given queryset
+        """
+        # handle VISIBLE > ARCHIVED state changes first if necessary
+        cls._bulk_update_state(msgs, dict(visibility=VISIBLE), dict(visibility=ARCHIVED), OrgEvent.msg_archived)
+
+        released = cls._bulk_update_state(msgs, dict(visibility=ARCHIVED), dict(visibility=DELETED, text=""),
+                                          OrgEvent.msg_deleted)
+        if released:
+            # remove labels
+            cls.labels.through.objects.filter(msg_id__in=[msg.pk for msg in released]).delete()
+
+        return released
+
     @classmethod
     def apply_action_label(cls, msgs, label, add):
         return label.toggle_label(msgs, add)
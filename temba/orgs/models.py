@@ -15,7 +15,7 @@ from dateutil.relativedelta import relativedelta
 from datetime import datetime, timedelta
 from decimal import Decimal
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Sum, Count, F
 from django.utils import timezone
 from django.conf import settings
@@ -183,6 +183,32 @@ class OrgModelMixin(object):
 
         return bool(rows_updated)
 
+    @classmethod
+    def _bulk_update_state(cls, queryset, required_state, new_state, event):
+        """
+        Bulk version of _update_state which updates all objects in the given queryset which are in the required state
+        with a single query, and triggers an org event for each. Returns the objects which were actually changed.
+        """
+        with transaction.atomic():
+            # lock the rows we're changing so that the org caches are updated for exactly those objects
+            changed = list(queryset.filter(**required_state).select_for_update())
+            if not changed:
+                return changed
+
+            cls.objects.filter(pk__in=[obj.pk for obj in changed]).update(**new_state)
+
+        orgs_by_id = {org.pk: org for org in Org.objects.filter(pk__in={obj.org_id for obj in changed})}
+
+        for obj in changed:
+            # update each object to new state
+            for attr_name, value in new_state.iteritems():
+                setattr(obj, attr_name, value)
+
+            obj.org = orgs_by_id[obj.org_id]
+            obj.org.update_caches(event, obj)
+
+        return changed
+
 
 class Org(SmartModel):
     """